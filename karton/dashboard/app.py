@@ -1,15 +1,16 @@
+import csv
+import io
 import json
 import logging
 import os
 import re
 import textwrap
-import threading
 from collections import defaultdict
 from datetime import datetime
 from itertools import product
 from operator import itemgetter
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import mistune  # type: ignore
 from flask import (
@@ -17,7 +18,6 @@ from flask import (
     Flask,
     abort,
     jsonify,
-    make_response,
     redirect,
     render_template,
     request,
@@ -41,7 +41,9 @@ from prometheus_client import (  # type: ignore
 )
 
 from .__version__ import __version__
-from .graph import KartonGraph
+from .graph import KartonGraph, PipelineLoadRegistry
+from .limits import AdmissionControl
+from .replicas import DashboardState, ReplicaRegistry
 
 # Disable default collector metrics
 # https://prometheus.github.io/client_python/collector/
@@ -63,6 +65,19 @@ karton = KartonDashboard()
 
 base_path = karton.config.get("dashboard", "base_path", fallback="")
 
+admission = AdmissionControl(karton.config)
+admission.budget.instrument(karton.backend.redis)
+
+replica_registry = ReplicaRegistry(
+    karton.backend,
+    karton.config.getint("dashboard", "replicas_refresh_interval", 10),
+)
+
+pipeline_load = PipelineLoadRegistry(
+    lambda: DashboardState(karton.backend, replica_registry),
+    karton.config.getint("dashboard", "graph_refresh_interval", 30),
+)
+
 app_path = Path(__file__).parent
 static_folder = app_path / "static"
 graph_folder = app_path / "graph"
@@ -84,6 +99,85 @@ def cancel_tasks(tasks: List[Task]) -> None:
         karton.backend.set_task_status(task=task, status=TaskState.FINISHED)
 
 
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FIELDS = [
+    "uid",
+    "root_uid",
+    "parent_uid",
+    "status",
+    "priority",
+    "last_update",
+    "headers",
+    "error",
+]
+
+
+def iter_queue_tasks(
+    queue_name: str, crashed: bool, since: Optional[float] = None
+) -> Iterator[Task]:
+    """
+    Iterate over the pending or crashed tasks of a queue without loading
+    the whole Karton state into memory.
+    """
+    for task in karton.backend.iter_all_tasks(
+        chunk_size=EXPORT_BATCH_SIZE, parse_resources=False
+    ):
+        if task.headers.get("receiver") != queue_name:
+            continue
+        if task.status == TaskState.FINISHED:
+            continue
+        if (task.status == TaskState.CRASHED) != crashed:
+            continue
+        if since is not None and task.last_update <= since:
+            continue
+        yield task
+
+
+def export_fields(with_payload: bool) -> List[str]:
+    if with_payload:
+        return EXPORT_FIELDS + ["payload", "payload_persistent"]
+    return EXPORT_FIELDS
+
+
+def export_task(task: Task, with_payload: bool) -> Dict[str, Any]:
+    task_data = task.to_dict()
+    # Drop the compatibility entry added by Task.to_dict
+    task_data["payload_persistent"].pop("__headers_persistent", None)
+    return {field: task_data[field] for field in export_fields(with_payload)}
+
+
+def export_ndjson(tasks: Iterator[Task], with_payload: bool) -> Iterator[str]:
+    for task in tasks:
+        yield json.dumps(export_task(task, with_payload), sort_keys=True) + "\n"
+
+
+def export_csv(tasks: Iterator[Task], with_payload: bool) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush() -> str:
+        row = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return row
+
+    fields = export_fields(with_payload)
+    writer.writerow(fields)
+    yield flush()
+    for task in tasks:
+        task_data = export_task(task, with_payload)
+        # Nested values are stored as JSON within a single column
+        writer.writerow(
+            [
+                json.dumps(task_data[field], sort_keys=True)
+                if isinstance(task_data[field], (dict, list))
+                else task_data[field]
+                for field in fields
+            ]
+        )
+        yield flush()
+
+
 def find_task_resource(
     task: Task,
     bucket: str,
@@ -227,16 +321,20 @@ class AnalysisView:
         }
 
 
+@app.template_filter("pretty_duration")
+def pretty_duration(seconds: int) -> str:
+    if seconds < 180:
+        return f"{seconds} seconds"
+    minutes = seconds // 60
+    if minutes < 180:
+        return f"{minutes} minutes"
+    hours = minutes // 60
+    return f"{hours} hours"
+
+
 def pretty_delta(dt: datetime) -> str:
     diff = datetime.now() - dt
-    seconds_diff = int(diff.total_seconds())
-    if seconds_diff < 180:
-        return f"{seconds_diff} seconds ago"
-    minutes_diff = seconds_diff // 60
-    if minutes_diff < 180:
-        return f"{minutes_diff} minutes ago"
-    hours_diff = minutes_diff // 60
-    return f"{hours_diff} hours ago"
+    return f"{pretty_duration(int(diff.total_seconds()))} ago"
 
 
 @app.template_filter("render_description")
@@ -306,54 +404,39 @@ def add_metrics(state: KartonState, metric: KartonMetrics, key: str) -> None:
         karton_metrics.labels(key, name).set(value)
 
 
-varz_lock = threading.Lock()
-
-
 @blueprint.route("/varz", methods=["GET"])
+@admission.limit("varz")
 def varz() -> Response:
     """Update and get prometheus metrics"""
+    state = DashboardState(karton.backend, replica_registry)
 
-    # Allow only one thread to enter this function
-    if not varz_lock.acquire(blocking=False):
-        return make_response(
-            jsonify({"error": "Previous vars collection is in a process"}),
-            429,
-        )
-
-    try:
-        state = KartonState(karton.backend)
+    # Clear the metrics completely to account for disappearing queues
+    karton_tasks.clear()
+    karton_replicas.clear()
 
-        # Clear the metrics completely to account for disappearing queues
-        karton_tasks.clear()
-        karton_replicas.clear()
+    for queue in state.queues.values():
+        safe_name = re.sub("[^a-z0-9]", "_", queue.bind.identity.lower())
+        task_infos: Dict[Tuple[str, TaskPriority, TaskState], int] = defaultdict(int)
+        for task in queue.tasks:
+            task_infos[(safe_name, task.priority, task.status)] += 1
 
-        for queue in state.queues.values():
-            safe_name = re.sub("[^a-z0-9]", "_", queue.bind.identity.lower())
-            task_infos: Dict[Tuple[str, TaskPriority, TaskState], int] = defaultdict(
-                int
-            )
-            for task in queue.tasks:
-                task_infos[(safe_name, task.priority, task.status)] += 1
+        # set the default of active queues to 0 to avoid gaps in graphs
+        for priority, status in product(TaskPriority, TaskState):
+            karton_tasks.labels(safe_name, priority.value, status.value).set(0)
 
-            # set the default of active queues to 0 to avoid gaps in graphs
-            for priority, status in product(TaskPriority, TaskState):
-                karton_tasks.labels(safe_name, priority.value, status.value).set(0)
+        for (name, priority, status), count in task_infos.items():
+            karton_tasks.labels(name, priority.value, status.value).set(count)
 
-            for (name, priority, status), count in task_infos.items():
-                karton_tasks.labels(name, priority.value, status.value).set(count)
+        replicas = len(state.replicas[queue.bind.identity])
+        karton_replicas.labels(safe_name, queue.bind.version).set(replicas)
 
-            replicas = len(state.replicas[queue.bind.identity])
-            karton_replicas.labels(safe_name, queue.bind.version).set(replicas)
+    add_metrics(state, KartonMetrics.TASK_ASSIGNED, "assigned")
+    add_metrics(state, KartonMetrics.TASK_CONSUMED, "consumed")
+    add_metrics(state, KartonMetrics.TASK_CRASHED, "crashed")
+    add_metrics(state, KartonMetrics.TASK_GARBAGE_COLLECTED, "garbage-collected")
+    add_metrics(state, KartonMetrics.TASK_PRODUCED, "produced")
 
-        add_metrics(state, KartonMetrics.TASK_ASSIGNED, "assigned")
-        add_metrics(state, KartonMetrics.TASK_CONSUMED, "consumed")
-        add_metrics(state, KartonMetrics.TASK_CRASHED, "crashed")
-        add_metrics(state, KartonMetrics.TASK_GARBAGE_COLLECTED, "garbage-collected")
-        add_metrics(state, KartonMetrics.TASK_PRODUCED, "produced")
-
-        return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
-    finally:
-        varz_lock.release()
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
 
 
 @blueprint.route("/static/<path:path>", methods=["GET"])
@@ -362,23 +445,23 @@ def static(path: str):
 
 
 @blueprint.route("/", methods=["GET"])
+@admission.limit("heavy")
 def get_queues():
-    state = KartonState(karton.backend)
+    state = DashboardState(karton.backend, replica_registry)
     return render_template("index.html", queues=state.queues)
 
 
 @blueprint.route("/services", methods=["GET"])
+@admission.limit("light")
 def get_services():
-    aggregated_services = defaultdict(list)
-    online_services = karton.backend.get_online_services()
-    for service in online_services:
-        aggregated_services[service].append(service)
-    return render_template("services.html", services=aggregated_services)
+    services = replica_registry.snapshot.services
+    return render_template("services.html", services=services)
 
 
 @blueprint.route("/api/queues", methods=["GET"])
+@admission.limit("heavy")
 def get_queues_api():
-    state = KartonState(karton.backend)
+    state = DashboardState(karton.backend, replica_registry)
     return jsonify(
         {
             identity: QueueView(queue).to_dict()
@@ -388,8 +471,9 @@ def get_queues_api():
 
 
 @blueprint.route("/<queue_name>/restart_crashed", methods=["POST"])
+@admission.limit("heavy")
 def restart_crashed_queue_tasks(queue_name):
-    state = KartonState(karton.backend)
+    state = DashboardState(karton.backend, replica_registry)
     queue = state.queues.get(queue_name)
     if not queue:
         return jsonify({"error": "Queue doesn't exist"}), 404
@@ -400,8 +484,9 @@ def restart_crashed_queue_tasks(queue_name):
 
 
 @blueprint.route("/<queue_name>/cancel_crashed", methods=["POST"])
+@admission.limit("heavy")
 def cancel_crashed_queue_tasks(queue_name):
-    state = KartonState(karton.backend)
+    state = DashboardState(karton.backend, replica_registry)
     queue = state.queues.get(queue_name)
     if not queue:
         return jsonify({"error": "Queue doesn't exist"}), 404
@@ -411,8 +496,9 @@ def cancel_crashed_queue_tasks(queue_name):
 
 
 @blueprint.route("/<queue_name>/cancel_pending", methods=["POST"])
+@admission.limit("heavy")
 def cancel_pending_queue_tasks(queue_name):
-    state = KartonState(karton.backend)
+    state = DashboardState(karton.backend, replica_registry)
     queue = state.queues.get(queue_name)
     if not queue:
         return jsonify({"error": "Queue doesn't exist"}), 404
@@ -422,6 +508,7 @@ def cancel_pending_queue_tasks(queue_name):
 
 
 @blueprint.route("/restart_task/<task_id>/restart", methods=["POST"])
+@admission.limit("light")
 def restart_task(task_id):
     task = karton.backend.get_task(task_id)
     if not task:
@@ -432,6 +519,7 @@ def restart_task(task_id):
 
 
 @blueprint.route("/cancel_task/<task_id>/cancel", methods=["POST"])
+@admission.limit("light")
 def cancel_task(task_id):
     task = karton.backend.get_task(task_id)
     if not task:
@@ -442,8 +530,9 @@ def cancel_task(task_id):
 
 
 @blueprint.route("/queue/<queue_name>", methods=["GET"])
+@admission.limit("heavy")
 def get_queue(queue_name):
-    state = KartonState(karton.backend)
+    state = DashboardState(karton.backend, replica_registry)
     queue = state.queues.get(queue_name)
     if not queue:
         return jsonify({"error": "Queue doesn't exist"}), 404
@@ -452,8 +541,9 @@ def get_queue(queue_name):
 
 
 @blueprint.route("/queue/<queue_name>/crashed", methods=["GET"])
+@admission.limit("heavy")
 def get_crashed_queue(queue_name):
-    state = KartonState(karton.backend)
+    state = DashboardState(karton.backend, replica_registry)
     queue = state.queues.get(queue_name)
     if not queue:
         return jsonify({"error": "Queue doesn't exist"}), 404
@@ -462,15 +552,50 @@ def get_crashed_queue(queue_name):
 
 
 @blueprint.route("/api/queue/<queue_name>", methods=["GET"])
+@admission.limit("heavy")
 def get_queue_api(queue_name):
-    state = KartonState(karton.backend)
+    state = DashboardState(karton.backend, replica_registry)
     queue = state.queues.get(queue_name)
     if not queue:
         return jsonify({"error": "Queue doesn't exist"}), 404
     return jsonify(QueueView(queue).to_dict())
 
 
+@blueprint.route("/api/queue/<queue_name>/export", methods=["GET"])
+@admission.limit("heavy")
+def export_queue_api(queue_name):
+    if queue_name not in {bind.identity for bind in karton.backend.get_binds()}:
+        return jsonify({"error": "Queue doesn't exist"}), 404
+
+    state = request.args.get("state", "crashed")
+    if state not in ("crashed", "pending"):
+        return jsonify({"error": "State must be either crashed or pending"}), 400
+
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in ("ndjson", "csv"):
+        return jsonify({"error": "Format must be either ndjson or csv"}), 400
+
+    since = request.args.get("since", type=float)
+    if "since" in request.args and since is None:
+        return jsonify({"error": "Since must be a Unix timestamp"}), 400
+
+    with_payload = request.args.get("payload", "0").lower() in ("1", "true")
+
+    tasks = iter_queue_tasks(queue_name, crashed=state == "crashed", since=since)
+    if export_format == "csv":
+        body, mimetype = export_csv(tasks, with_payload), "text/csv"
+    else:
+        body, mimetype = export_ndjson(tasks, with_payload), "application/x-ndjson"
+
+    response = Response(body, mimetype=mimetype)
+    response.headers[
+        "Content-Disposition"
+    ] = f"attachment; filename={queue_name}-{state}.{export_format}"
+    return response
+
+
 @blueprint.route("/task/<task_id>", methods=["GET"])
+@admission.limit("light")
 def get_task(task_id):
     task = karton.backend.get_task(task_id)
     if not task:
@@ -482,6 +607,7 @@ def get_task(task_id):
 
 
 @blueprint.route("/api/task/<task_id>", methods=["GET"])
+@admission.limit("light")
 def get_task_api(task_id):
     task = karton.backend.get_task(task_id)
     if not task:
@@ -490,8 +616,9 @@ def get_task_api(task_id):
 
 
 @blueprint.route("/analysis/<root_id>", methods=["GET"])
+@admission.limit("heavy")
 def get_analysis(root_id):
-    state = KartonState(karton.backend)
+    state = DashboardState(karton.backend, replica_registry)
     analysis = state.get_analysis(root_id)
     if not analysis.tasks:
         return jsonify({"error": "Analysis doesn't exist"}), 404
@@ -502,8 +629,9 @@ def get_analysis(root_id):
 
 
 @blueprint.route("/api/analysis/<root_id>", methods=["GET"])
+@admission.limit("heavy")
 def get_analysis_api(root_id):
-    state = KartonState(karton.backend)
+    state = DashboardState(karton.backend, replica_registry)
     analysis = state.get_analysis(root_id)
     if not analysis.tasks:
         return jsonify({"error": "Analysis doesn't exist"}), 404
@@ -517,9 +645,11 @@ def get_graph():
 
 
 @blueprint.route("/graph/generate", methods=["GET"])
+@admission.limit("heavy")
 def generate_graph():
-    state = KartonState(karton.backend)
-    graph = KartonGraph(state)
+    state = DashboardState(karton.backend, replica_registry)
+    load = pipeline_load.snapshot if request.args.get("load") == "1" else None
+    graph = KartonGraph(state, load=load)
     raw_graph = graph.generate_graph()
 
     return raw_graph
@@ -529,6 +659,7 @@ def generate_graph():
     "/resource/download/<task_id>/<bucket>/<resource_uid>",
     methods=["GET"],
 )
+@admission.limit("light")
 def download_resource(task_id, bucket, resource_uid):
     task = karton.backend.get_task(task_id)
     if not task:
@@ -1,3 +1,4 @@
 from .graph import KartonGraph
+from .load import PipelineLoad, PipelineLoadRegistry
 
-__all__ = ["KartonGraph"]
+__all__ = ["KartonGraph", "PipelineLoad", "PipelineLoadRegistry"]
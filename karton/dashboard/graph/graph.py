@@ -3,18 +3,66 @@ from __future__ import annotations
 from typing import Any, Callable, Dict, List, Optional, Set, cast
 
 from karton.core.inspect import KartonState
-from networkx import DiGraph, generate_gexf  # type: ignore
+from networkx import (  # type: ignore
+    DiGraph,
+    condensation,
+    dag_longest_path,
+    generate_gexf,
+)
 from networkx.readwrite.json_graph import (  # type: ignore
     adjacency_data,
     adjacency_graph,
 )
 
+from .load import NodeLoad, PipelineLoad
+
 NODE_SIZE: Callable[[DiGraph, str], float] = (
     lambda graph, identity: 65 + 3.5 * graph.in_degree(identity)
 )
 DEFAULT_OPTIONS = {"color": {"r": 51, "g": 153, "b": 243, "a": 0}, "size": NODE_SIZE}
 EMPTY_METADATA = {"version": "none", "info": "none"}
+EMPTY_LOAD = NodeLoad(pending=0, crashed=0, consumed=0)
 OPTIONS = ["color", "size"]
+BACKLOG_COLOR = {"r": 253, "g": 126, "b": 20, "a": 0}
+CRITICAL_COLOR = {"r": 220, "g": 53, "b": 69, "a": 0}
+CRITICAL_THICKNESS = 6
+
+
+def critical_path(graph: DiGraph, weights: Dict[str, float]) -> List[List[str]]:
+    """Find the path through the graph with the highest total weight.
+
+    Cycles are collapsed first, so each step of the path is a list of
+    node identities forming a cycle (or a single node).
+
+    :param graph: a graph object
+    :type graph: networkx.DiGraph
+    :param weights: weight of each node identity, missing nodes weigh 0
+    :return: steps of the path, ordered from the path start
+    """
+    condensed = condensation(graph)
+    component_weights = {
+        component: sum(weights.get(member, 0) for member in members)
+        for component, members in condensed.nodes(data="members")
+    }
+    for u, v in condensed.edges:
+        condensed.edges[u, v]["weight"] = component_weights[v]
+    # Virtual source, so the weight of the first component is counted too
+    source = -1
+    for component, weight in component_weights.items():
+        condensed.add_edge(source, component, weight=weight)
+
+    path = [
+        component
+        for component in dag_longest_path(condensed, default_weight=0)
+        if component != source
+    ]
+    # Trim components that don't contribute to the path weight
+    while path and component_weights[path[0]] <= 0:
+        path.pop(0)
+    while path and component_weights[path[-1]] <= 0:
+        path.pop()
+
+    return [sorted(condensed.nodes[component]["members"]) for component in path]
 
 
 class KartonNode:
@@ -40,8 +88,9 @@ class KartonNode:
 
 
 class KartonGraph:
-    def __init__(self, state: KartonState) -> None:
+    def __init__(self, state: KartonState, load: Optional[PipelineLoad] = None) -> None:
         self.state: KartonState = state
+        self.load: Optional[PipelineLoad] = load
         self.nodes: List[KartonNode] = []
         self.graph: Dict[str, Set[str]] = {}
 
@@ -78,6 +127,61 @@ class KartonGraph:
             graph.nodes[node.identity]["version"] = node.metadata["version"]
             graph.nodes[node.identity]["info"] = node.metadata["info"]
 
+    def style_load(self, graph: DiGraph) -> None:
+        """Annotate the graph with the pipeline load and highlight the
+        critical path, where the backlog grows the fastest. Before rates
+        are known, the path with the largest backlog is highlighted.
+
+        :param graph: a graph object
+        :type graph: networkx.DiGraph
+        """
+        if self.load is None:
+            return
+
+        weights = {}
+        for identity, node_load in self.load.nodes.items():
+            if self.load.has_rates:
+                weights[identity] = max(node_load.backlog_rate or 0.0, 0.0)
+            else:
+                weights[identity] = float(node_load.pending)
+
+        position = {
+            identity: index
+            for index, step in enumerate(critical_path(graph, weights))
+            for identity in step
+        }
+
+        for node in self.nodes:
+            attributes = graph.nodes[node.identity]
+            node_load = self.load.nodes.get(node.identity, EMPTY_LOAD)
+            attributes["pending"] = node_load.pending
+            attributes["crashed"] = node_load.crashed
+            # Replicas are known for producers too, not only for bound queues
+            attributes["replicas"] = len(self.state.replicas.get(node.identity, []))
+            attributes["critical"] = node.identity in position
+            # Unknown rates are left out rather than shown as 0
+            if node_load.consumed_rate is not None:
+                attributes["consumed_rate"] = node_load.consumed_rate
+            if node_load.backlog_rate is not None:
+                attributes["backlog_rate"] = node_load.backlog_rate
+
+            if node.identity in position:
+                attributes["viz"]["color"] = CRITICAL_COLOR
+            elif node_load.pending:
+                attributes["viz"]["color"] = BACKLOG_COLOR
+
+        for u, v, attributes in graph.edges(data=True):
+            # Edges within a cycle on the path or leading to its next step
+            critical = (
+                u in position and v in position and position[v] - position[u] in (0, 1)
+            )
+            attributes["critical"] = critical
+            if critical:
+                attributes["viz"] = {
+                    "color": CRITICAL_COLOR,
+                    "thickness": CRITICAL_THICKNESS,
+                }
+
     def build_nodes(self) -> None:
         values = {}
 
@@ -129,6 +233,7 @@ class KartonGraph:
 
         nx_graph = DiGraph(self.graph)
         self.style_nodes(nx_graph)
+        self.style_load(nx_graph)
 
         adj_data = adjacency_data(nx_graph)
         adj_graph = adjacency_graph(adj_data)
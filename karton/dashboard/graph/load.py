@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Callable, Dict, NamedTuple, Optional
+
+from karton.core.backend import KartonMetrics
+from karton.core.inspect import KartonState
+
+# Maximum age of the previous snapshot used for rates, in refresh intervals
+RATE_WINDOW = 3
+
+
+class NodeLoad(NamedTuple):
+    pending: int
+    crashed: int
+    # Total number of consumed tasks reported by the service
+    consumed: int
+    # Tasks per second since the previous snapshot, None for the first one
+    consumed_rate: Optional[float] = None
+    backlog_rate: Optional[float] = None
+
+
+class PipelineLoad(NamedTuple):
+    timestamp: float
+    nodes: Dict[str, NodeLoad]
+
+    @property
+    def has_rates(self) -> bool:
+        return any(node.backlog_rate is not None for node in self.nodes.values())
+
+
+def rate(current: int, previous: int, interval: float) -> Optional[float]:
+    if interval <= 0:
+        return None
+    return round((current - previous) / interval, 3)
+
+
+def measure_load(
+    state: KartonState, previous: Optional[PipelineLoad] = None
+) -> PipelineLoad:
+    """
+    Take a snapshot of queue backlog and consumed tasks of all services.
+
+    Rates are computed against the previous snapshot, if one is given.
+    """
+    timestamp = time.monotonic()
+    consumed = state.backend.get_metrics(KartonMetrics.TASK_CONSUMED)
+
+    nodes = {}
+    for identity, queue in state.queues.items():
+        node = NodeLoad(
+            pending=len(queue.pending_tasks),
+            crashed=len(queue.crashed_tasks),
+            consumed=consumed.get(identity, 0),
+        )
+        last = previous.nodes.get(identity) if previous else None
+        if previous and last:
+            interval = timestamp - previous.timestamp
+            node = node._replace(
+                backlog_rate=rate(node.pending, last.pending, interval),
+                # Counter going down means that metrics were reset
+                consumed_rate=rate(node.consumed, last.consumed, interval)
+                if node.consumed >= last.consumed
+                else None,
+            )
+        nodes[identity] = node
+    return PipelineLoad(timestamp=timestamp, nodes=nodes)
+
+
+class PipelineLoadRegistry:
+    """
+    Cached :class:`PipelineLoad` snapshot, taken at most once per
+    `refresh_interval` seconds.
+
+    :param state_factory: Callable returning a fresh :class:`KartonState`
+    :param refresh_interval: Maximum age of the snapshot in seconds.
+        Rates are only computed when the previous snapshot is at most
+        `RATE_WINDOW` intervals old.
+    """
+
+    def __init__(
+        self, state_factory: Callable[[], KartonState], refresh_interval: int
+    ) -> None:
+        self.state_factory = state_factory
+        self.refresh_interval = refresh_interval
+        self._snapshot: Optional[PipelineLoad] = None
+        self._lock = threading.Lock()
+
+    @property
+    def snapshot(self) -> PipelineLoad:
+        with self._lock:
+            previous = self._snapshot
+            if previous is not None:
+                age = time.monotonic() - previous.timestamp
+                if age < self.refresh_interval:
+                    return previous
+                # Rates averaged over a long idle period don't describe
+                # the current load, start over without them
+                if age > RATE_WINDOW * max(self.refresh_interval, 1):
+                    previous = None
+            self._snapshot = measure_load(self.state_factory(), previous)
+            return self._snapshot
@@ -0,0 +1,274 @@
+import math
+import threading
+import time
+from collections import deque
+from functools import wraps
+from typing import Any, Callable, Deque, Dict, NamedTuple, Optional
+
+from flask import jsonify, make_response
+from flask.wrappers import Response
+from karton.core.config import Config
+from prometheus_client import Counter, Gauge  # type: ignore
+
+dashboard_rejected = Counter(
+    "karton_dashboard_rejected_requests",
+    "Requests rejected by the dashboard admission control",
+    ("route", "reason"),
+)
+dashboard_queued = Gauge(
+    "karton_dashboard_queued_requests",
+    "Requests waiting for a free slot",
+    ("route",),
+)
+dashboard_inflight = Gauge(
+    "karton_dashboard_inflight_requests",
+    "Requests currently being handled",
+    ("route",),
+)
+dashboard_redis_commands = Counter(
+    "karton_dashboard_redis_commands",
+    "Redis commands issued by the dashboard",
+)
+
+
+class CostClass(NamedTuple):
+    """
+    Limits shared by all routes of similar cost.
+
+    Every route gets its own set of slots, the cost class only
+    describes how many of them there are.
+    """
+
+    name: str
+    # Number of requests handled at the same time
+    concurrency: int
+    # Number of requests allowed to wait for a free slot
+    queue_size: int
+    # Seconds a queued request waits before being rejected
+    queue_timeout: int
+    # Whether the route is subject to the Redis command budget
+    budgeted: bool = True
+
+
+DEFAULT_COST_CLASSES = {
+    # Single task lookups and actions
+    "light": CostClass("light", concurrency=8, queue_size=16, queue_timeout=5),
+    # Full state scans: queue listings, analyses, graph
+    "heavy": CostClass("heavy", concurrency=2, queue_size=4, queue_timeout=10),
+    # Prometheus scrape, never rejected because of the Redis budget
+    "varz": CostClass(
+        "varz", concurrency=1, queue_size=0, queue_timeout=0, budgeted=False
+    ),
+}
+
+
+def load_cost_classes(config: Config) -> Dict[str, CostClass]:
+    """
+    Read cost classes from the `[dashboard]` section, e.g.
+    `heavy_concurrency`, `heavy_queue_size` and `heavy_queue_timeout`.
+    """
+    return {
+        name: cost_class._replace(
+            concurrency=config.getint(
+                "dashboard", f"{name}_concurrency", cost_class.concurrency
+            ),
+            queue_size=config.getint(
+                "dashboard", f"{name}_queue_size", cost_class.queue_size
+            ),
+            queue_timeout=config.getint(
+                "dashboard", f"{name}_queue_timeout", cost_class.queue_timeout
+            ),
+        )
+        for name, cost_class in DEFAULT_COST_CLASSES.items()
+    }
+
+
+class RedisBudget:
+    """
+    Token bucket of Redis commands per second the dashboard allows itself.
+
+    Commands are charged after they are issued, so a single expensive request
+    can drive the bucket into debt. Further budgeted requests are rejected
+    until the debt is paid off.
+
+    :param rate: Commands per second, 0 disables the budget
+    """
+
+    def __init__(self, rate: int) -> None:
+        self.rate = rate
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            float(self.rate), self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def charge(self, commands: int = 1) -> None:
+        dashboard_redis_commands.inc(commands)
+        if not self.enabled:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens -= commands
+
+    def retry_after(self) -> int:
+        """Seconds until the budget is out of debt, 0 if it's not in debt"""
+        if not self.enabled:
+            return 0
+        with self._lock:
+            self._refill()
+            if self._tokens > 0:
+                return 0
+            return max(1, math.ceil(-self._tokens / self.rate))
+
+    def instrument(self, redis: Any) -> None:
+        """Charge every command issued by the Redis client, including pipelines"""
+        execute_command = redis.execute_command
+        make_pipeline = redis.pipeline
+
+        @wraps(execute_command)
+        def counted_execute_command(*args, **kwargs):
+            self.charge()
+            return execute_command(*args, **kwargs)
+
+        @wraps(make_pipeline)
+        def counted_pipeline(*args, **kwargs):
+            pipeline = make_pipeline(*args, **kwargs)
+            execute = pipeline.execute
+
+            @wraps(execute)
+            def counted_execute(*args, **kwargs):
+                self.charge(len(pipeline.command_stack))
+                return execute(*args, **kwargs)
+
+            pipeline.execute = counted_execute
+            return pipeline
+
+        redis.execute_command = counted_execute_command
+        redis.pipeline = counted_pipeline
+
+
+class RouteLimiter:
+    """
+    Concurrency limiter with a bounded FIFO wait queue for a single route.
+
+    New requests don't take a freed slot while others are already waiting.
+    """
+
+    def __init__(self, route: str, cost_class: CostClass) -> None:
+        self.route = route
+        self.cost_class = cost_class
+        self._available = cost_class.concurrency
+        self._waiters: Deque[object] = deque()
+        self._condition = threading.Condition()
+
+    def acquire(self) -> bool:
+        with self._condition:
+            if not self._waiters and self._available > 0:
+                self._available -= 1
+                return True
+            if len(self._waiters) >= self.cost_class.queue_size:
+                return False
+
+            waiter = object()
+            self._waiters.append(waiter)
+            dashboard_queued.labels(self.route).inc()
+            try:
+                admitted = self._condition.wait_for(
+                    lambda: self._waiters[0] is waiter and self._available > 0,
+                    timeout=self.cost_class.queue_timeout,
+                )
+                if admitted:
+                    self._available -= 1
+                return admitted
+            finally:
+                self._waiters.remove(waiter)
+                dashboard_queued.labels(self.route).dec()
+                # Let the next waiter check whether it's at the front now
+                self._condition.notify_all()
+
+    def release(self) -> None:
+        with self._condition:
+            self._available += 1
+            self._condition.notify_all()
+
+
+def service_unavailable(error: str, retry_after: int) -> Response:
+    response = make_response(jsonify({"error": error}), 503)
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+class AdmissionControl:
+    """
+    Per-route admission control for the dashboard endpoints.
+
+    Use :py:meth:`limit` as a view decorator (placed below `route`).
+    Saturated routes respond with 503 and a `Retry-After` header.
+    """
+
+    def __init__(self, config: Config) -> None:
+        self.cost_classes = load_cost_classes(config)
+        self.budget = RedisBudget(config.getint("dashboard", "redis_budget", 0))
+
+    def limit(self, cost: str) -> Callable[[Callable], Callable]:
+        cost_class = self.cost_classes[cost]
+
+        def decorator(view: Callable) -> Callable:
+            limiter = RouteLimiter(view.__name__, cost_class)
+
+            @wraps(view)
+            def limited_view(*args, **kwargs):
+                return self._handle(limiter, view, *args, **kwargs)
+
+            return limited_view
+
+        return decorator
+
+    def _check_budget(self, limiter: RouteLimiter) -> Optional[Response]:
+        if not limiter.cost_class.budgeted:
+            return None
+        retry_after = self.budget.retry_after()
+        if not retry_after:
+            return None
+        dashboard_rejected.labels(limiter.route, "redis_budget").inc()
+        return service_unavailable("Redis command budget exceeded", retry_after)
+
+    def _handle(self, limiter: RouteLimiter, view: Callable, *args, **kwargs):
+        rejected = self._check_budget(limiter)
+        if rejected is not None:
+            return rejected
+
+        if not limiter.acquire():
+            dashboard_rejected.labels(limiter.route, "concurrency").inc()
+            return service_unavailable(
+                "Too many concurrent requests",
+                max(1, limiter.cost_class.queue_timeout),
+            )
+
+        dashboard_inflight.labels(limiter.route).inc()
+
+        def release() -> None:
+            dashboard_inflight.labels(limiter.route).dec()
+            limiter.release()
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except BaseException:
+            release()
+            raise
+        if not response.is_streamed:
+            release()
+            return response
+        # Streamed responses hold the slot until the WSGI server closes them,
+        # which also happens when the body is never iterated (e.g. HEAD)
+        response.call_on_close(release)
+        return response
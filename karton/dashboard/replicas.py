@@ -0,0 +1,179 @@
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, cast
+
+from karton.core.backend import KartonBackend, KartonServiceInfo
+from karton.core.inspect import KartonState
+
+logger = logging.getLogger(__name__)
+
+
+class Replica(NamedTuple):
+    identity: str
+    karton_version: Optional[str]
+    service_version: Optional[str]
+    host: str
+    # Seconds since the replica connected to Redis
+    age: int
+
+
+class ServiceReplicas:
+    """
+    Replicas of a single service sharing the same identity and versions.
+    """
+
+    def __init__(
+        self,
+        identity: str,
+        karton_version: str,
+        service_version: Optional[str],
+        replicas: List[Replica],
+    ) -> None:
+        self.identity = identity
+        self.karton_version = karton_version
+        self.service_version = service_version
+        self.replicas = replicas
+
+    @property
+    def count(self) -> int:
+        return len(self.replicas)
+
+    @property
+    def hosts(self) -> List[Tuple[str, int]]:
+        """Number of replicas per host"""
+        return sorted(Counter(replica.host for replica in self.replicas).items())
+
+    @property
+    def longest_uptime(self) -> int:
+        return max(replica.age for replica in self.replicas)
+
+    @property
+    def shortest_uptime(self) -> int:
+        return min(replica.age for replica in self.replicas)
+
+
+class ReplicaSnapshot(NamedTuple):
+    # All named Redis clients grouped by identity
+    consumers: Dict[str, List[Replica]]
+    # Replicas providing extended service information
+    services: List[ServiceReplicas]
+
+
+def parse_replica(client: Dict[str, str]) -> Optional[Replica]:
+    name = client.get("name")
+    if not name:
+        return None
+
+    host = client.get("addr", "").rsplit(":", 1)[0]
+    age = int(client.get("age", 0))
+    if "?" not in name:
+        return Replica(name, None, None, host, age)
+
+    try:
+        service_info = KartonServiceInfo.parse_client_name(name)
+    except Exception:
+        logger.exception("Fatal error while parsing client name: %s", name)
+        return None
+    return Replica(
+        service_info.identity,
+        service_info.karton_version,
+        service_info.service_version,
+        host,
+        age,
+    )
+
+
+class ReplicaRegistry:
+    """
+    Shared, periodically refreshed view of online Karton replicas.
+
+    `CLIENT LIST` is expensive on Redis instances with many clients, so it's
+    issued at most once per `refresh_interval` seconds, no matter how many
+    requests need replica information. Refresh is done lazily by the first
+    request that finds the snapshot outdated, the others wait for its result.
+
+    :param backend: :py:meth:`KartonBackend` object to use for data fetching
+    :param refresh_interval: Maximum age of the snapshot in seconds
+    """
+
+    def __init__(self, backend: KartonBackend, refresh_interval: int) -> None:
+        self.backend = backend
+        self.refresh_interval = refresh_interval
+        self._snapshot: Optional[ReplicaSnapshot] = None
+        self._updated = 0.0
+        self._lock = threading.Lock()
+
+    def fetch(self) -> ReplicaSnapshot:
+        consumers: Dict[str, List[Replica]] = defaultdict(list)
+        services: Dict[Tuple[str, str, Optional[str]], List[Replica]] = defaultdict(
+            list
+        )
+        for client in self.backend.redis.client_list():
+            replica = parse_replica(client)
+            if replica is None:
+                continue
+            consumers[replica.identity].append(replica)
+            if replica.karton_version is not None:
+                key = (
+                    replica.identity,
+                    replica.karton_version,
+                    replica.service_version,
+                )
+                services[key].append(replica)
+
+        return ReplicaSnapshot(
+            consumers=dict(consumers),
+            services=[
+                ServiceReplicas(identity, karton_version, service_version, replicas)
+                for (identity, karton_version, service_version), replicas in sorted(
+                    services.items(), key=lambda item: (item[0][:2], item[0][2] or "")
+                )
+            ],
+        )
+
+    @property
+    def snapshot(self) -> ReplicaSnapshot:
+        with self._lock:
+            now = time.monotonic()
+            if self._snapshot is None or now - self._updated >= self.refresh_interval:
+                self._snapshot = self.fetch()
+                self._updated = now
+            return self._snapshot
+
+
+class RegistryBackend:
+    """
+    Backend proxy answering :py:meth:`get_online_consumers` from the registry
+    snapshot, everything else is passed to the wrapped backend.
+    """
+
+    def __init__(self, backend: KartonBackend, registry: ReplicaRegistry) -> None:
+        self._backend = backend
+        self._registry = registry
+
+    def get_online_consumers(self) -> Dict[str, List[Replica]]:
+        return defaultdict(list, self._registry.snapshot.consumers)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._backend, name)
+
+
+class DashboardState(KartonState):
+    """
+    :class:`KartonState` taking replicas from the shared :class:`ReplicaRegistry`
+    instead of issuing `CLIENT LIST` for every instance.
+    """
+
+    def __init__(
+        self,
+        backend: KartonBackend,
+        registry: ReplicaRegistry,
+        parse_resources: bool = False,
+    ) -> None:
+        super().__init__(
+            cast(KartonBackend, RegistryBackend(backend, registry)),
+            parse_resources=parse_resources,
+        )
+        self.backend = backend
@@ -5,10 +5,8 @@ var allNodes;
 var nodeData = {};
 var isLabelsHidden = false;
 
-const attr = {
-  version: "0",
-  info: "1",
-};
+// Node attribute ids keyed by their title, read from the GEXF definitions
+var attr = {};
 
 const loadingOpts = {
   text: 'loading graph, please wait'
@@ -31,6 +29,7 @@ $.get(dom.getAttribute('data-generate-url'), function(raw_graph) {
   myChart.resize();
 
   var graph = echarts.dataTool.gexf.parse(raw_graph);
+  attr = parseAttributeIds(raw_graph);
   allNodes = arrayToObject(graph.nodes);
 
   option = {
@@ -46,19 +45,19 @@ $.get(dom.getAttribute('data-generate-url'), function(raw_graph) {
     tooltip: {
       formatter: function (params) {
         if (params.dataType == "node") {
-          var nodeDescColor = "#3399F3";
           var colorSpan =
             '<span style="display:inline-block;margin-left:5px;border-radius:10px;width:9px;height:9px;background-color:' +
-            nodeDescColor +
+            params.color +
             '"></span>';
           // is node
-          res = params.data.id + colorSpan;
+          res = params.data.id + colorSpan + loadSummary(params.data, "<br/>");
         } else if (params.dataType == "edge") {
           // is edge
           res =
             allNodes[params.data.source].name +
             " → " +
-            allNodes[params.data.target].name;
+            allNodes[params.data.target].name +
+            loadSummary(allNodes[params.data.target], "<br/>");
         }
         return res;
       },
@@ -224,9 +223,11 @@ function showInformation(node, color) {
   var $lefty = $(".side-menu");
   $lefty.name = $lefty.find(".name");
   $lefty.version = $lefty.find(".version");
+  $lefty.load = $lefty.find(".load");
   $lefty.about = $lefty.find(".about");
 
   $lefty.name.html("<b>Name: </b>" + node.name);
+  $lefty.load.html(loadSummary(node, ""));
 
   if (node.hasOwnProperty("attributes") && node.attributes != null) {
     if (
@@ -255,9 +256,54 @@ function clearWindow() {
 
   $lefty.name = $lefty.find(".name");
   $lefty.version = $lefty.find(".version");
+  $lefty.load = $lefty.find(".load");
   $lefty.about = $lefty.find(".about");
 
   $lefty.name.html("");
   $lefty.version.html("");
+  $lefty.load.html("");
   $lefty.about.html("");
 }
+
+function parseAttributeIds(raw_graph) {
+  var doc =
+    typeof raw_graph === "string"
+      ? new DOMParser().parseFromString(raw_graph, "text/xml")
+      : raw_graph;
+  var ids = {};
+  $(doc)
+    .find("attributes[class='node'] attribute")
+    .each(function () {
+      ids[this.getAttribute("title")] = this.getAttribute("id");
+    });
+  return ids;
+}
+
+function loadSummary(node, prefix) {
+  if (
+    !node.hasOwnProperty("attributes") ||
+    node.attributes == null ||
+    !(attr.pending in node.attributes)
+  ) {
+    return "";
+  }
+
+  var res =
+    prefix +
+    "<b>Pending: </b>" + node.attributes[attr.pending] + "<br/>" +
+    "<b>Crashed: </b>" + node.attributes[attr.crashed] + "<br/>" +
+    "<b>Replicas: </b>" + node.attributes[attr.replicas] + "<br/>";
+
+  if (attr.consumed_rate in node.attributes) {
+    res += "<b>Consumed: </b>" + node.attributes[attr.consumed_rate] + " tasks/s<br/>";
+  }
+
+  if (attr.backlog_rate in node.attributes) {
+    res += "<b>Backlog growth: </b>" + node.attributes[attr.backlog_rate] + " tasks/s<br/>";
+  }
+
+  if (String(node.attributes[attr.critical]) == "true") {
+    res += "<b>On the critical path</b><br/>";
+  }
+  return res;
+}